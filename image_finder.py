@@ -1,43 +1,209 @@
 from PIL import Image, ImageGrab
 import imagehash
+import numpy as np
 from pathlib import Path
 import sys
 import shutil
 import os
 from datetime import datetime
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import threading
+import queue
+import hashlib
+import json
+import time
+import zipfile
+import tarfile
 
-def get_image_hash(image_path):
-    """计算图片的感知哈希值"""
+# 8种二面体变换（原图、旋转90/180/270度、水平/垂直翻转、主/副对角线翻转）
+DIHEDRAL_TRANSFORMS = (
+    None,
+    Image.Transpose.ROTATE_90,
+    Image.Transpose.ROTATE_180,
+    Image.Transpose.ROTATE_270,
+    Image.Transpose.FLIP_LEFT_RIGHT,
+    Image.Transpose.FLIP_TOP_BOTTOM,
+    Image.Transpose.TRANSPOSE,
+    Image.Transpose.TRANSVERSE,
+)
+
+# 局部搜索的多尺度网格：n 表示边长为原图 1/n 的子区域，按半个子区域的步长滑动
+TILE_GRID_SIZES = (2, 3)
+# 切分子区域前先把大图缩小到该尺寸以内，避免在原始分辨率上反复缩放
+TILE_WORK_SIZE = 768
+
+# 动图最多采样的帧数，以及视为重复帧的最大哈希差异（三种哈希合计的位数）
+MAX_FRAMES = 16
+FRAME_DEDUPE_BITS = 8
+
+# 颜色签名的 HSV 量化级数：色相 8 级、饱和度 3 级、明度 3 级，共 72 个 uint8
+COLOR_BINS = (8, 3, 3)
+
+# 按扩展名识别的图片格式
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
+
+# 支持直接搜索的压缩包格式，压缩包内的图片以 "压缩包!成员" 的形式表示
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+ARCHIVE_SEPARATOR = '!'
+
+# 向量化匹配时每块处理的图库行数，限制临时数组的内存占用
+MATCH_CHUNK_ROWS = 16384
+
+# 0-255 每个字节中1的个数，用于向量化计算汉明距离
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def _prepare_hash_image(img):
+    """将图片转换为RGB并缩放到哈希尺寸，返回(缩放后的图片, 是否为缩略图)"""
+    # 将图片转换为RGB模式
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # 获取图片尺寸
+    width, height = img.size
+    is_thumbnail = width <= 300 or height <= 300
+    
+    if is_thumbnail:
+        # 对于缩略图，使用更小的目标尺寸
+        target_size = (32, 32)
+    else:
+        # 对于普通图片，使用较大的目标尺寸
+        target_size = (64, 64)
+        
+    # 调整图片大小
+    img = img.resize(target_size, Image.Resampling.LANCZOS)
+    return img, is_thumbnail
+
+def _compute_hashes(img):
+    """对已缩放的图片计算 (average hash, dhash, whash)"""
+    avg_hash = imagehash.average_hash(img)
+    dhash = imagehash.dhash(img)  # 对边缘更敏感
+    whash = imagehash.whash(img)  # 小波变换哈希，对细节更敏感
+    return avg_hash, dhash, whash
+
+def _compute_color_signature(img):
+    """对已缩放的图片计算量化 HSV 直方图，shape (72,) 的 uint8，总和约为 255"""
+    hsv = np.asarray(img.convert('HSV'), dtype=np.uint16).reshape(-1, 3)
+    h_bins, s_bins, v_bins = COLOR_BINS
+    index = ((hsv[:, 0] * h_bins >> 8) * s_bins + (hsv[:, 1] * s_bins >> 8)) * v_bins \
+        + (hsv[:, 2] * v_bins >> 8)
+    hist = np.bincount(index, minlength=h_bins * s_bins * v_bins)
+    return np.round(hist * 255 / hist.sum()).astype(np.uint8)
+
+def get_color_signature(img):
+    """计算任意图片（如剪贴板图片）的颜色签名，与图库签名使用相同的缩放"""
+    img, _ = _prepare_hash_image(img)
+    return _compute_color_signature(img)
+
+def color_distances(query_signature, library_signatures):
+    """一次计算查询签名与所有图库签名的 L1 距离，归一化到 0~1
+    
+    library_signatures: shape (N, 72)，返回 shape (N,)
+    """
+    query = np.asarray(query_signature, dtype=np.int16)
+    library = np.asarray(library_signatures, dtype=np.int16).reshape(-1, query.shape[-1])
+    return np.abs(library - query).sum(axis=1) / 510
+
+def blend_color_distance(hash_dists, color_dists, weight=0.3):
+    """将归一化的哈希距离与颜色距离按 weight 加权混合"""
+    return (1 - weight) * np.asarray(hash_dists) + weight * np.asarray(color_dists)
+
+def _iter_tiles(img):
+    """按 TILE_GRID_SIZES 生成多尺度、半步重叠的子区域"""
+    width, height = img.size
+    for n in TILE_GRID_SIZES:
+        tile_w, tile_h = width / n, height / n
+        steps = 2 * n - 1
+        for row in range(steps):
+            for col in range(steps):
+                left = col * tile_w / 2
+                top = row * tile_h / 2
+                yield img.crop((round(left), round(top),
+                                round(left + tile_w), round(top + tile_h)))
+
+def _compute_tile_bits(img):
+    """计算所有子区域的打包哈希，返回每个子区域 shape (3, B) 的列表"""
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    if max(img.size) > TILE_WORK_SIZE:
+        img = img.copy()
+        img.thumbnail((TILE_WORK_SIZE, TILE_WORK_SIZE), Image.Resampling.BILINEAR)
+    
+    tile_bits = []
+    for tile in _iter_tiles(img):
+        tile, _ = _prepare_hash_image(tile)
+        tile_bits.append(hashes_to_bits(_compute_hashes(tile)))
+    return tile_bits
+
+def _compute_frame_bits(img, first_frame_bits):
+    """对动图均匀采样至多 MAX_FRAMES 帧并计算打包哈希，跳过与上一保留帧几乎相同的帧
+    
+    返回除第一帧外各保留帧 shape (3, B) 的列表；静态图片返回空列表。
+    """
+    n_frames = getattr(img, 'n_frames', 1)
+    if n_frames <= 1:
+        return []
+    
+    step = max(1, n_frames / MAX_FRAMES)
+    indices = sorted({int(i * step) for i in range(min(n_frames, MAX_FRAMES))} - {0})
+    frame_bits = []
+    previous = first_frame_bits
+    for index in indices:
+        img.seek(index)
+        frame, _ = _prepare_hash_image(img)
+        bits = hashes_to_bits(_compute_hashes(frame))
+        if _POPCOUNT_TABLE[bits ^ previous].sum() <= FRAME_DEDUPE_BITS:
+            continue
+        frame_bits.append(bits)
+        previous = bits
+    return frame_bits
+
+def get_image_hash(image_path, tiles=False, frames=False):
+    """计算图片的感知哈希值
+    
+    返回 (avg_hash, dhash, whash, is_thumbnail, 颜色签名)，颜色签名由同一张缩放图计算。
+    tiles 为 True 时在同一次解码中额外计算子区域哈希（用于局部/裁剪搜索），
+    frames 为 True 时对动图 GIF/WebP 额外计算采样帧的哈希；两者任一开启时，
+    返回值末尾追加 shape (T, 3, B) 的打包子哈希数组，第0行为整图（第一帧），
+    之后依次为子区域和其他帧，查询与其中任一行匹配即视为匹配该图片。
+    """
     try:
-        with Image.open(image_path) as img:
-            # 将图片转换为RGB模式
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # 获取图片尺寸
-            width, height = img.size
-            is_thumbnail = width <= 300 or height <= 300
-            
-            if is_thumbnail:
-                # 对于缩略图，使用更小的目标尺寸
-                target_size = (32, 32)
-            else:
-                # 对于普通图片，使用较大的目标尺寸
-                target_size = (64, 64)
-                
-            # 调整图片大小
-            img = img.resize(target_size, Image.Resampling.LANCZOS)
-            
-            # 使用多种哈希算法组合
-            avg_hash = imagehash.average_hash(img)
-            dhash = imagehash.dhash(img)  # 对边缘更敏感
-            whash = imagehash.whash(img)  # 小波变换哈希，对细节更敏感
-            
-            return (avg_hash, dhash, whash, is_thumbnail)
+        return _hash_image(image_path, tiles, frames)
     except Exception as e:
-        print(f"处理图片 {image_path} 时出错: {e}")
+        print(f"处理图片 {getattr(image_path, 'name', image_path)} 时出错: {e}")
         return None
 
+def _hash_image(image_path, tiles=False, frames=False):
+    """get_image_hash 的实现，出错时直接抛出异常，便于调用方记录异常类型"""
+    with Image.open(image_path) as img:
+        original = img
+        img, is_thumbnail = _prepare_hash_image(img)
+        
+        # 使用多种哈希算法组合
+        avg_hash, dhash, whash = _compute_hashes(img)
+        color_signature = _compute_color_signature(img)
+        
+        if tiles or frames:
+            sub_bits = [hashes_to_bits((avg_hash, dhash, whash))]
+            if tiles:
+                sub_bits.extend(_compute_tile_bits(original))
+            if frames:
+                sub_bits.extend(_compute_frame_bits(original, sub_bits[0]))
+            return (avg_hash, dhash, whash, is_thumbnail, color_signature, np.stack(sub_bits))
+        return (avg_hash, dhash, whash, is_thumbnail, color_signature)
+
+def get_pil_image_hash(img):
+    """计算已打开图片（剪贴板或查询图片）的哈希值，缩放与哈希方式与图库图片一致"""
+    img, is_thumbnail = _prepare_hash_image(img)
+    
+    # 使用多种哈希算法
+    avg_hash, dhash, whash = _compute_hashes(img)
+    color_signature = _compute_color_signature(img)
+    
+    return (avg_hash, dhash, whash, is_thumbnail, color_signature)
+
 def get_clipboard_image_hash():
     """获取剪贴板图片的哈希值"""
     try:
@@ -46,31 +212,630 @@ def get_clipboard_image_hash():
             print("剪贴板中没有图片")
             return None
             
-        # 将图片转换为RGB模式
-        if clipboard_image.mode != 'RGB':
-            clipboard_image = clipboard_image.convert('RGB')
-            
-        # 获取图片尺寸
-        width, height = clipboard_image.size
-        is_thumbnail = width <= 300 or height <= 300
-        
-        if is_thumbnail:
-            target_size = (32, 32)
-        else:
-            target_size = (64, 64)
-            
-        clipboard_image = clipboard_image.resize(target_size, Image.Resampling.LANCZOS)
-        
-        # 使用多种哈希算法
-        avg_hash = imagehash.average_hash(clipboard_image)
-        dhash = imagehash.dhash(clipboard_image)
-        whash = imagehash.whash(clipboard_image)
-        
-        return (avg_hash, dhash, whash, is_thumbnail)
+        return get_pil_image_hash(clipboard_image)
     except Exception as e:
         print(f"获取剪贴板图片时出错: {e}")
         return None
 
+def get_variant_hashes(img):
+    """计算图片8种旋转/翻转变体的哈希值
+    
+    只缩放一次，再在缩放后的小图上做变换，开销可以忽略。
+    返回 ([(avg_hash, dhash, whash), ...], is_thumbnail, 颜色签名)，第一个元素为原始方向。
+    颜色签名与方向无关，只计算一次。
+    """
+    img, is_thumbnail = _prepare_hash_image(img)
+    variants = []
+    for transform in DIHEDRAL_TRANSFORMS:
+        variant = img if transform is None else img.transpose(transform)
+        variants.append(_compute_hashes(variant))
+    return variants, is_thumbnail, _compute_color_signature(img)
+
+def get_clipboard_variant_hashes():
+    """获取剪贴板图片8种旋转/翻转变体的哈希值"""
+    try:
+        clipboard_image = ImageGrab.grabclipboard()
+        if clipboard_image is None:
+            print("剪贴板中没有图片")
+            return None
+        return get_variant_hashes(clipboard_image)
+    except Exception as e:
+        print(f"获取剪贴板图片时出错: {e}")
+        return None
+
+def hashes_to_bits(hashes):
+    """将 (avg_hash, dhash, whash, ...) 打包为 shape (3, 字节数) 的 uint8 数组"""
+    return np.stack([np.packbits(h.hash.flatten()) for h in hashes[:3]])
+
+def match_hash_variants(variant_bits, library_bits, weights=None):
+    """向量化比较所有查询变体与整个图库，返回每张图库图片的最小差异
+    
+    按 MATCH_CHUNK_ROWS 行分块计算，临时数组大小与图库规模无关。
+    variant_bits: shape (V, 3, B)，查询图片各变体的打包哈希
+    library_bits: shape (N, 3, B)，图库图片的打包哈希
+    weights: 三种哈希的权重，shape (3,) 或 (N, 3)，默认取平均
+    返回 (最小差异 shape (N,), 最佳变体下标 shape (N,))
+    """
+    variant_bits = np.asarray(variant_bits, dtype=np.uint8)
+    library_bits = np.asarray(library_bits, dtype=np.uint8)
+    if library_bits.shape[0] == 0:
+        return np.zeros(0), np.zeros(0, dtype=np.intp)
+    if weights is None:
+        weights = np.full(3, 1 / 3)
+    weights = np.asarray(weights, dtype=np.float64)
+    
+    n_rows = library_bits.shape[0]
+    best_diffs = np.empty(n_rows)
+    best_variants = np.empty(n_rows, dtype=np.intp)
+    for start in range(0, n_rows, MATCH_CHUNK_ROWS):
+        end = min(start + MATCH_CHUNK_ROWS, n_rows)
+        chunk_weights = weights
+        if weights.ndim == 2:
+            # (n, 3) -> (n, 1, 3)，对所有变体广播
+            chunk_weights = weights[start:end, None, :]
+        
+        # (n, 1, 3, B) ^ (1, V, 3, B) -> (n, V, 3)
+        xor = library_bits[start:end, None] ^ variant_bits[None]
+        diffs = _POPCOUNT_TABLE[xor].sum(axis=-1, dtype=np.int32)
+        total = (diffs * chunk_weights).sum(axis=-1)
+        best = total.argmin(axis=1)
+        best_diffs[start:end] = total[np.arange(end - start), best]
+        best_variants[start:end] = best
+    return best_diffs, best_variants
+
+def is_archive(path):
+    """判断文件是否为支持搜索的压缩包"""
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+def split_archive_path(path):
+    """将 "压缩包!成员" 路径拆分为 (压缩包路径, 成员名)，普通路径返回 None"""
+    path = str(path)
+    index = path.find(ARCHIVE_SEPARATOR)
+    while index != -1:
+        archive = path[:index]
+        if is_archive(archive) and os.path.isfile(archive):
+            # Windows 下 Path 会把成员名中的 / 转换为 \
+            return archive, path[index + 1:].replace('\\', '/')
+        index = path.find(ARCHIVE_SEPARATOR, index + 1)
+    return None
+
+def iter_archive_images(archive_path, image_extensions, skip=None, on_error=None):
+    """逐个读取压缩包中的图片成员，不解压到磁盘，生成 (虚拟路径, 文件内容)
+    
+    skip(虚拟路径) 为真的成员不读取；单个成员读取失败（校验错误、加密等）时调用
+    on_error(虚拟路径, 异常) 并继续读取其余成员。
+    """
+    archive_path = Path(archive_path)
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or Path(info.filename).suffix.lower() not in image_extensions:
+                    continue
+                virtual_path = Path(f"{archive_path}{ARCHIVE_SEPARATOR}{info.filename}")
+                if skip is not None and skip(virtual_path):
+                    continue
+                try:
+                    data = zf.read(info)
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    on_error(virtual_path, e)
+                    continue
+                yield virtual_path, data
+    else:
+        # 顺序流式读取，避免 tar.gz 等压缩格式来回定位
+        with tarfile.open(archive_path, mode='r|*') as tf:
+            for member in tf:
+                if not member.isfile() or Path(member.name).suffix.lower() not in image_extensions:
+                    continue
+                virtual_path = Path(f"{archive_path}{ARCHIVE_SEPARATOR}{member.name}")
+                if skip is not None and skip(virtual_path):
+                    continue
+                try:
+                    f = tf.extractfile(member)
+                    data = None if f is None else f.read()
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    on_error(virtual_path, e)
+                    continue
+                if data is not None:
+                    yield virtual_path, data
+
+def read_image_bytes(path):
+    """读取图片文件内容，支持 "压缩包!成员" 路径"""
+    archive_member = split_archive_path(path)
+    if archive_member is None:
+        return Path(path).read_bytes()
+    archive, member = archive_member
+    if zipfile.is_zipfile(archive):
+        with zipfile.ZipFile(archive) as zf:
+            return zf.read(member)
+    with tarfile.open(archive) as tf:
+        return tf.extractfile(member).read()
+
+def open_image(path):
+    """打开图片，支持 "压缩包!成员" 路径"""
+    if split_archive_path(path) is None:
+        return Image.open(path)
+    return Image.open(BytesIO(read_image_bytes(path)))
+
+def copy_image_file(path, dest_path):
+    """复制图片文件，压缩包内的图片直接写出内容"""
+    if split_archive_path(path) is None:
+        shutil.copy2(path, dest_path)
+    else:
+        Path(dest_path).write_bytes(read_image_bytes(path))
+
+# 无法解码的文件记录在此，文件未变化前后续扫描直接跳过
+QUARANTINE_FILE = Path.home() / '.image_finder' / 'quarantine.json'
+# 单个文件解码超过该秒数视为异常，结束卡住的解码进程并记录
+DECODE_TIMEOUT = 30
+# 解码进程异常退出时，同一文件单独解码最多尝试的次数
+MAX_DECODE_ATTEMPTS = 2
+
+class Quarantine:
+    """持久化的解码失败记录（负缓存）
+    
+    以路径为键记录文件大小、修改时间和异常类型。文件大小或修改时间变化后记录失效，
+    下次扫描会重新尝试解码。压缩包成员以 "压缩包!成员" 为键，记录所在压缩包的大小和修改时间。
+    """
+    def __init__(self, path=QUARANTINE_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            self.entries = json.loads(self.path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_quarantined(self, path):
+        """文件是否已被记录且之后未被修改"""
+        key = str(path)
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return False
+        try:
+            stat = self._stat(path)
+        except OSError:
+            return False
+        if stat.st_size == entry['size'] and stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        # 文件已变化，移除记录以便重新尝试
+        with self._lock:
+            self.entries.pop(key, None)
+            self._dirty = True
+        return False
+
+    @staticmethod
+    def _stat(path):
+        archive_member = split_archive_path(path)
+        return os.stat(path if archive_member is None else archive_member[0])
+
+    def add(self, path, error_type, message=''):
+        try:
+            stat = self._stat(path)
+        except OSError:
+            return
+        with self._lock:
+            self.entries[str(path)] = {
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'error': error_type,
+                'message': message,
+                'time': datetime.now().isoformat(timespec='seconds'),
+            }
+            self._dirty = True
+
+    def remove(self, path):
+        with self._lock:
+            if self.entries.pop(str(path), None) is not None:
+                self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self.entries = {}
+            self._dirty = True
+
+    def save(self):
+        """有改动时写回磁盘"""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self.entries)
+            self._dirty = False
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text(json.dumps(entries, ensure_ascii=False, indent=1), encoding='utf-8')
+        except OSError as e:
+            print(f"保存损坏文件记录失败: {e}")
+
+    def report(self):
+        """返回按路径排序的 [(路径, 记录), ...]"""
+        with self._lock:
+            return sorted(self.entries.items())
+
+def full_digest(data):
+    """完整内容摘要，摘要相同即认为文件字节一致"""
+    return hashlib.blake2b(data).digest()
+
+def library_version(paths):
+    """根据文件路径、大小和修改时间计算图库版本戳，任一文件增删改都会改变结果"""
+    digest = hashlib.blake2b(digest_size=16)
+    for path in sorted(str(p) for p in paths):
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+        except OSError:
+            digest.update(f"{path}\0-\n".encode('utf-8', 'surrogateescape'))
+    return digest.hexdigest()
+
+def sort_paths_for_reading(paths):
+    """按目录和 inode 排序，使机械硬盘/网络共享上的读取尽量顺序进行"""
+    def sort_key(path):
+        try:
+            inode = os.stat(path).st_ino
+        except OSError:
+            inode = 0
+        return (str(Path(path).parent), inode)
+    return sorted(paths, key=sort_key)
+
+# 解码进程中用于通知主进程"开始解码"的队列，由 _init_decode_worker 设置
+_decode_started = None
+
+def _init_decode_worker(started_queue):
+    global _decode_started
+    _decode_started = started_queue
+
+def _decode_worker(hash_function, task_id, path, data, tiles, frames):
+    """在解码进程中计算哈希，返回 (哈希或 None, (异常类型, 异常信息) 或 None)
+    
+    开始解码时先把 task_id 放入 _decode_started，主进程从收到这一通知起计算超时。
+    """
+    _decode_started.put(task_id)
+    try:
+        buffer = BytesIO(data)
+        buffer.name = str(path)
+        return hash_function(buffer, tiles=tiles, frames=frames), None
+    except Exception as e:
+        print(f"处理图片 {path} 时出错: {e}")
+        return None, (type(e).__name__, str(e))
+
+def _terminate_pool(executor):
+    """结束进程池的全部工作进程，包括卡在解码中的进程"""
+    terminate = getattr(executor, 'terminate_workers', None)  # Python 3.14+
+    if terminate is not None:
+        terminate()
+        return
+    for process in list((executor._processes or {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False, cancel_futures=True)
+
+class ReadAheadPipeline:
+    """读取与解码分离的哈希流水线
+    
+    I/O 线程按目录/inode 顺序以大块顺序读取文件内容，放入有界的预读队列；
+    解码进程池从内存缓冲区解码并计算哈希，只在有空闲进程时提交新文件。
+    两侧并发数可分别调节，queue_depths() 返回两侧当前的排队情况，用于调优。
+    
+    quarantine 为 Quarantine 对象时跳过已记录且未变化的损坏文件，并记录新的解码失败；
+    单个文件从开始解码起超过 decode_timeout 秒时结束卡住的解码进程，同样记录在案，
+    同时在解码的其他文件换到新的进程池中重新解码。
+    
+    dedupe 为 True 时先按内容摘要查重，字节完全相同的文件只解码一次并共用哈希，
+    duplicate_of 记录 {副本路径: 被解码的那份文件路径}。
+    exact_query 为查询图片的文件内容时，与其字节一致的文件记录在 exact_matches 中。
+    
+    输入中的压缩包由 I/O 线程逐个读取其中扩展名属于 image_extensions 的成员，
+    成员以 "压缩包!成员" 路径与普通文件一样解码、查重和记录失败。
+    read_errors 为读取失败的文件或压缩包个数（通常是暂时性的错误，不记录在案）。
+    """
+    _DONE = object()
+    # 在解码进程中调用的哈希函数，须为可按名称 pickle 的模块级函数
+    hash_function = staticmethod(_hash_image)
+
+    def __init__(self, io_workers=2, cpu_workers=4, read_ahead=32, tiles=False, frames=False,
+                 block_size=1024 * 1024, dedupe=True, exact_query=None, quarantine=None,
+                 decode_timeout=DECODE_TIMEOUT, image_extensions=IMAGE_EXTENSIONS):
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.read_ahead = read_ahead
+        self.tiles = tiles
+        self.frames = frames
+        self.block_size = block_size
+        self.dedupe = dedupe
+        self.quarantine = quarantine
+        self.decode_timeout = decode_timeout
+        self.image_extensions = image_extensions
+        self.quarantined_skipped = 0
+        self.read_errors = 0
+        self.decode_failures = 0
+        self.read_queue = queue.Queue(maxsize=read_ahead)
+        self.files_read = 0
+        self.bytes_read = 0
+        self.files_hashed = 0
+        self.duplicates_skipped = 0
+        self.duplicate_of = {}
+        self.exact_matches = set()
+        self._decode_pending = 0
+        self._lock = threading.Lock()
+        self._representatives = {}  # 内容摘要 -> 被解码的那份文件路径
+        self._hashes = {}  # 代表路径 -> 哈希（解码失败为 None）
+        self._waiting = {}  # 代表路径 -> 等待其解码结果的副本路径
+        self._failures = {}  # 代表路径 -> (异常类型, 异常信息)
+        self._query_digest = None if exact_query is None else full_digest(exact_query)
+
+    def queue_depths(self):
+        """返回 {'read': 已读取待解码的文件数, 'decode': 正在解码的文件数}"""
+        return {'read': self.read_queue.qsize(), 'decode': self._decode_pending}
+
+    def _read_file(self, path):
+        chunks = []
+        with open(path, 'rb', buffering=0) as f:
+            while True:
+                chunk = f.read(self.block_size)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def _put(self, read_queue, stop, item):
+        # 队列满时等待，但在流水线被提前关闭时退出
+        while not stop.is_set():
+            try:
+                read_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _io_worker(self, path_iter, path_lock, read_queue, stop):
+        try:
+            while not stop.is_set():
+                with path_lock:
+                    path = next(path_iter, None)
+                if path is None:
+                    break
+                if is_archive(path):
+                    if not self._read_archive(path, read_queue, stop):
+                        break
+                    continue
+                try:
+                    data = self._read_file(path)
+                except Exception as e:
+                    print(f"读取图片 {path} 时出错: {e}")
+                    with self._lock:
+                        self.read_errors += 1
+                    continue
+                if not self._put_data(read_queue, stop, path, data):
+                    break
+        finally:
+            self._put(read_queue, stop, self._DONE)
+
+    def _put_data(self, read_queue, stop, path, data):
+        # 完整摘要在读取线程中计算，分发线程查重时不再访问磁盘
+        digest = full_digest(data)
+        with self._lock:
+            self.files_read += 1
+            self.bytes_read += len(data)
+        return self._put(read_queue, stop, (path, data, digest))
+
+    def _read_archive(self, archive_path, read_queue, stop):
+        """把压缩包中的图片成员逐个放入预读队列，流水线被提前关闭时返回 False"""
+        def skip(virtual_path):
+            if self.quarantine is None or not self.quarantine.is_quarantined(virtual_path):
+                return False
+            with self._lock:
+                self.quarantined_skipped += 1
+            return True
+        
+        def on_error(virtual_path, error):
+            # 成员本身损坏（校验错误、加密等），与解码失败一样记录在案
+            print(f"读取图片 {virtual_path} 时出错: {error}")
+            self._record_failure(virtual_path, type(error).__name__, str(error))
+        
+        try:
+            for virtual_path, data in iter_archive_images(archive_path, self.image_extensions,
+                                                          skip, on_error):
+                if not self._put_data(read_queue, stop, virtual_path, data):
+                    return False
+        except Exception as e:
+            print(f"读取压缩包 {archive_path} 时出错: {e}")
+            with self._lock:
+                self.read_errors += 1
+        return True
+
+    def _find_representative(self, path, digest):
+        """查找与该文件字节一致、已提交解码的文件，没有则登记为新的代表"""
+        representative = self._representatives.setdefault(digest, path)
+        return None if representative == path else representative
+
+    def _start_decoder(self):
+        """创建解码进程池和用于接收"开始解码"通知的队列"""
+        # 使用 spawn，避免在已有读取线程的进程中 fork
+        context = multiprocessing.get_context('spawn')
+        started_queue = context.Queue()
+        executor = ProcessPoolExecutor(max_workers=self.cpu_workers, mp_context=context,
+                                       initializer=_init_decode_worker,
+                                       initargs=(started_queue,))
+        return executor, started_queue
+
+    def _record_failure(self, path, error_type, message=''):
+        with self._lock:
+            self.decode_failures += 1
+        if self.quarantine is not None:
+            self.quarantine.add(path, error_type, message)
+
+    def run(self, paths):
+        """依次生成 (路径, 哈希)，顺序与输入不同；读取或解码失败的文件被跳过"""
+        if self.quarantine is not None:
+            kept = [path for path in paths if not self.quarantine.is_quarantined(path)]
+            self.quarantined_skipped += len(paths) - len(kept)
+            paths = kept
+        path_iter = iter(sort_paths_for_reading(paths))
+        path_lock = threading.Lock()
+        # 每次运行使用新的队列和停止标志，避免与上一次提前关闭的运行互相干扰
+        read_queue = self.read_queue = queue.Queue(maxsize=self.read_ahead)
+        stop = threading.Event()
+        for _ in range(self.io_workers):
+            thread = threading.Thread(target=self._io_worker,
+                                      args=(path_iter, path_lock, read_queue, stop))
+            thread.daemon = True
+            thread.start()
+        
+        # 只在有空闲解码进程时提交，排队等待的时间不计入解码超时
+        finished_readers = 0
+        in_flight = {}  # future -> (任务编号, 路径, 文件内容, 单独解码时进程崩溃的次数)
+        start_times = {}  # 任务编号 -> 收到开始解码通知的时间
+        # 进程池崩溃时正在解码的文件无法分辨是哪个导致的，之后逐个单独解码
+        suspects = []
+        solo = False  # 当前唯一在解码的文件是否为单独重试的嫌疑文件
+        task_ids = iter(range(sys.maxsize))
+        executor, started_queue = self._start_decoder()
+        
+        def submit(task):
+            task_id, path, data, _ = task
+            future = executor.submit(_decode_worker, self.hash_function, task_id, path, data,
+                                     self.tiles, self.frames)
+            in_flight[future] = task
+        
+        try:
+            while True:
+                if suspects or (solo and in_flight):
+                    # 嫌疑文件单独解码期间不提交其他文件
+                    if not in_flight:
+                        solo = True
+                        submit(suspects.pop(0))
+                elif finished_readers < self.io_workers and len(in_flight) < self.cpu_workers:
+                    item = read_queue.get()
+                    if item is self._DONE:
+                        finished_readers += 1
+                        continue
+                    path, data, digest = item
+                    if digest == self._query_digest:
+                        self.exact_matches.add(path)
+                    if self.dedupe:
+                        representative = self._find_representative(path, digest)
+                        if representative is not None:
+                            # 字节完全相同，直接共用代表文件的哈希，无需解码
+                            self.duplicate_of[path] = representative
+                            self.duplicates_skipped += 1
+                            if representative in self._hashes:
+                                if self._hashes[representative] is not None:
+                                    yield path, self._hashes[representative]
+                                else:
+                                    self._record_failure(path, *self._failures[representative])
+                            else:
+                                self._waiting.setdefault(representative, []).append(path)
+                            continue
+                    solo = False
+                    submit((next(task_ids), path, data, 0))
+                    self._decode_pending = len(in_flight)
+                    continue
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, timeout=0.2, return_when=FIRST_COMPLETED)
+                
+                now = time.monotonic()
+                while True:
+                    try:
+                        start_times.setdefault(started_queue.get_nowait(), now)
+                    except queue.Empty:
+                        break
+                
+                results = []
+                retry = []
+                broken = False
+                for future in done:
+                    task = in_flight.pop(future)
+                    task_id, path, data, crashes = task
+                    start_times.pop(task_id, None)
+                    try:
+                        img_hashes, failure = future.result()
+                    except BrokenProcessPool:
+                        # 解码进程异常退出（例如解码器崩溃）。只有单独解码时崩溃才算作该文件的问题，
+                        # 否则和同时在解码的文件一起作为嫌疑文件逐个重试
+                        broken = True
+                        if not solo:
+                            suspects.append(task)
+                            continue
+                        if crashes + 1 < MAX_DECODE_ATTEMPTS:
+                            suspects.insert(0, (task_id, path, data, crashes + 1))
+                            continue
+                        img_hashes, failure = None, ('BrokenProcessPool', "解码进程异常退出")
+                    self.files_hashed += 1
+                    results.append((path, img_hashes, failure))
+                if broken:
+                    # 尚未返回的任务也会随进程池一起失败
+                    suspects.extend(in_flight.values())
+                    in_flight.clear()
+                
+                # 卡住的解码进程无法单独停止：记录超时的文件，结束整个进程池，
+                # 其余正在解码的文件在新的进程池中重新解码，不受牵连
+                timed_out = [future for future, task in in_flight.items()
+                             if now - start_times.get(task[0], now) > self.decode_timeout]
+                for future in timed_out:
+                    path = in_flight.pop(future)[1]
+                    print(f"处理图片 {path} 超时（超过 {self.decode_timeout} 秒）")
+                    self.files_hashed += 1
+                    results.append((path, None, ('TimeoutError', f"超过 {self.decode_timeout} 秒")))
+                if timed_out or broken:
+                    retry.extend(in_flight.values())
+                    in_flight.clear()
+                    start_times.clear()
+                    _terminate_pool(executor)
+                    executor, started_queue = self._start_decoder()
+                    for task in retry:
+                        submit(task)
+                self._decode_pending = len(in_flight)
+                
+                for path, img_hashes, failure in results:
+                    waiting = []
+                    if self.dedupe:
+                        self._hashes[path] = img_hashes
+                        waiting = self._waiting.pop(path, [])
+                    if failure is not None:
+                        self._failures[path] = failure
+                        for failed_path in [path] + waiting:
+                            self._record_failure(failed_path, *failure)
+                        continue
+                    if img_hashes is not None:
+                        yield path, img_hashes
+                        for duplicate in waiting:
+                            yield duplicate, img_hashes
+        finally:
+            stop.set()
+            if in_flight:
+                _terminate_pool(executor)
+            else:
+                executor.shutdown(wait=True)
+            if self.quarantine is not None:
+                self.quarantine.save()
+
+def aggregate_tile_matches(tile_diffs, owners, n_images, threshold=None):
+    """将子区域的匹配结果按所属图片汇总
+    
+    tile_diffs: shape (M,)，每个子区域的差异
+    owners: shape (M,)，每个子区域所属图片的下标
+    返回 (每张图片的最小差异 shape (n_images,), 差异低于 threshold 的子区域个数)
+    """
+    best = np.full(n_images, np.inf)
+    np.minimum.at(best, owners, tile_diffs)
+    if threshold is None:
+        hits = np.zeros(n_images, dtype=np.intp)
+    else:
+        hits = np.bincount(owners[tile_diffs < threshold], minlength=n_images)
+    return best, hits
+
+def stack_tile_index(tile_bits_list):
+    """把每张图片的子区域哈希拼接成一个索引，返回 (tile_bits shape (M, 3, B), owners shape (M,))"""
+    if not tile_bits_list:
+        return np.zeros((0, 3, 8), dtype=np.uint8), np.zeros(0, dtype=np.intp)
+    owners = np.repeat(np.arange(len(tile_bits_list)),
+                       [len(bits) for bits in tile_bits_list])
+    return np.concatenate(tile_bits_list), owners
+
 def copy_similar_images(similar_images, base_dir="."):
     """将相似图片复制到指定目录"""
     # 创建保存相似图片的目录
@@ -95,7 +860,7 @@ def copy_similar_images(similar_images, base_dir="."):
                 counter += 1
             
             # 复制文件
-            shutil.copy2(path, dest_path)
+            copy_image_file(path, dest_path)
             copied_files.append(dest_path)
             print(f"已复制: {path} -> {dest_path}")
         except Exception as e:
@@ -103,46 +868,113 @@ def copy_similar_images(similar_images, base_dir="."):
     
     return similar_dir, copied_files
 
-def find_similar_images(directory, threshold=12):
-    """查找与剪贴板图片相似的图片"""
-    clipboard_hashes = get_clipboard_image_hash()
-    if clipboard_hashes is None:
-        return
+def _hash_weights(query_is_thumbnail, img_is_thumbnail):
+    """根据是否为缩略图返回 (avg, dhash, whash) 的权重"""
+    if query_is_thumbnail == img_is_thumbnail:
+        return (0.4, 0.3, 0.3)
+    # 如果一个是缩略图一个不是，调整权重
+    return (0.3, 0.4, 0.3)
+
+def find_similar_images(directory, threshold=12, rotation_invariant=False, partial_match=False,
+                        include_archives=False, color_weight=0.0, max_color_distance=None,
+                        match_frames=False, io_workers=2, cpu_workers=4, read_ahead=32):
+    """查找与剪贴板图片相似的图片
+    
+    rotation_invariant 为 True 时同时匹配剪贴板图片旋转/翻转后的8种变体；
+    partial_match 为 True 时为每张图片建立子区域索引，用于查找剪贴板中的裁剪/局部截图；
+    include_archives 为 True 时同时搜索 zip/tar 压缩包内的图片；
+    color_weight 为颜色距离混入差异值的权重，max_color_distance 不为 None 时
+    先剔除颜色距离（0~1）超过该值的图片；
+    match_frames 为 True 时剪贴板图片与动图中任一采样帧相似即可匹配；
+    io_workers、cpu_workers、read_ahead 为读取线程数、解码线程数和预读队列长度。
+    """
+    if rotation_invariant:
+        clipboard_variants = get_clipboard_variant_hashes()
+        if clipboard_variants is None:
+            return
+        variant_hashes, clipboard_is_thumbnail, clipboard_color = clipboard_variants
+        clipboard_hashes = variant_hashes[0]
+    else:
+        clipboard_hashes = get_clipboard_image_hash()
+        if clipboard_hashes is None:
+            return
+        variant_hashes = [clipboard_hashes]
+        clipboard_is_thumbnail = clipboard_hashes[3]
+        clipboard_color = clipboard_hashes[4]
 
     image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
     directory_path = Path(directory)
     similar_images = []
+    library = []
+    tile_hits = {}
+    archives = []
     
-    clipboard_is_thumbnail = clipboard_hashes[3]
+    image_paths = []
     
     for image_path in directory_path.rglob('*'):
         if image_path.suffix.lower() in image_extensions:
-            img_hashes = get_image_hash(image_path)
-            if img_hashes is not None:
-                img_is_thumbnail = img_hashes[3]
-                
-                # 根据是否为缩略图调整权重
-                if clipboard_is_thumbnail == img_is_thumbnail:
-                    weight_avg = 0.4
-                    weight_dhash = 0.3
-                    weight_whash = 0.3
-                else:
-                    # 如果一个是缩略图一个不是，调整权重
-                    weight_avg = 0.3
-                    weight_dhash = 0.4
-                    weight_whash = 0.3
-                
-                # 计算加权平均差异
-                avg_diff = clipboard_hashes[0] - img_hashes[0]
-                dhash_diff = clipboard_hashes[1] - img_hashes[1]
-                whash_diff = clipboard_hashes[2] - img_hashes[2]
-                
-                total_diff = (avg_diff * weight_avg + 
-                            dhash_diff * weight_dhash + 
-                            whash_diff * weight_whash)
-                
-                if total_diff < threshold:
-                    similar_images.append((image_path, total_diff, img_is_thumbnail))
+            image_paths.append(image_path)
+        elif include_archives and is_archive(image_path) and image_path.is_file():
+            archives.append(image_path)
+    
+    # 读取与解码分离，读取按目录/inode 顺序进行；字节完全相同的文件只解码一次
+    # 已知无法解码且未变化的文件直接跳过
+    # 压缩包内的图片不解压，由读取线程直接取出成员内容，与普通文件一同解码
+    pipeline = ReadAheadPipeline(io_workers=io_workers, cpu_workers=cpu_workers,
+                                 read_ahead=read_ahead, tiles=partial_match,
+                                 frames=match_frames, quarantine=Quarantine(),
+                                 image_extensions=image_extensions)
+    library.extend(pipeline.run(image_paths + archives))
+    
+    color_dists = np.zeros(len(library))
+    if (color_weight or max_color_distance is not None) and library:
+        # 颜色签名已在计算哈希时得到，这里一次向量化比较整个图库
+        color_dists = color_distances(clipboard_color, np.stack([h[4] for _, h in library]))
+        if max_color_distance is not None:
+            keep = color_dists <= max_color_distance
+            library = [entry for entry, kept in zip(library, keep) if kept]
+            color_dists = color_dists[keep]
+    
+    has_sub_hashes = partial_match or match_frames
+    if (rotation_invariant or has_sub_hashes) and library:
+        # 所有变体与整个图库（或子区域/帧索引）一次性向量化比较，取每张图片的最佳得分
+        variant_bits = np.stack([hashes_to_bits(h) for h in variant_hashes])
+        if has_sub_hashes:
+            tile_bits, owners = stack_tile_index([h[5] for _, h in library])
+        else:
+            tile_bits = np.stack([hashes_to_bits(h) for _, h in library])
+            owners = np.arange(len(library))
+        weights = np.array([_hash_weights(clipboard_is_thumbnail, h[3]) for _, h in library])
+        tile_diffs, _ = match_hash_variants(variant_bits, tile_bits, weights[owners])
+        best_diffs, hits = aggregate_tile_matches(tile_diffs, owners, len(library), threshold)
+        if color_weight:
+            best_diffs = 64 * blend_color_distance(best_diffs / 64, color_dists, color_weight)
+        for (image_path, img_hashes), total_diff, hit_count in zip(library, best_diffs, hits):
+            if total_diff < threshold:
+                similar_images.append((image_path, float(total_diff), img_hashes[3]))
+                if partial_match:
+                    tile_hits[image_path] = int(hit_count)
+    else:
+        for (image_path, img_hashes), color_dist in zip(library, color_dists):
+            img_is_thumbnail = img_hashes[3]
+            
+            # 根据是否为缩略图调整权重
+            weight_avg, weight_dhash, weight_whash = _hash_weights(
+                clipboard_is_thumbnail, img_is_thumbnail)
+            
+            # 计算加权平均差异
+            avg_diff = clipboard_hashes[0] - img_hashes[0]
+            dhash_diff = clipboard_hashes[1] - img_hashes[1]
+            whash_diff = clipboard_hashes[2] - img_hashes[2]
+            
+            total_diff = (avg_diff * weight_avg + 
+                        dhash_diff * weight_dhash + 
+                        whash_diff * weight_whash)
+            if color_weight:
+                total_diff = 64 * float(blend_color_distance(total_diff / 64, color_dist, color_weight))
+            
+            if total_diff < threshold:
+                similar_images.append((image_path, total_diff, img_is_thumbnail))
     
     # 按相似度排序
     similar_images.sort(key=lambda x: x[1])
@@ -155,6 +987,10 @@ def find_similar_images(directory, threshold=12):
             similarity = 100 - (diff/64*100)
             if similarity > 25:  # 降低相似度阈值
                 thumb_mark = "[缩略图]" if is_thumb else ""
+                if path in tile_hits:
+                    thumb_mark += f"[命中{tile_hits[path]}个区域]"
+                if path in pipeline.duplicate_of:
+                    thumb_mark += f"[与 {pipeline.duplicate_of[path]} 完全相同]"
                 print(f"相似度: {similarity:.2f}% {thumb_mark} - {path}")
                 filtered_images.append((path, diff, is_thumb))
         
@@ -166,11 +1002,56 @@ def find_similar_images(directory, threshold=12):
     else:
         print("没有找到相似的图片")
 
+def print_quarantine_report(quarantine=None):
+    """列出被记录为无法解码的文件"""
+    if quarantine is None:
+        quarantine = Quarantine()
+    entries = quarantine.report()
+    if not entries:
+        print("没有记录的损坏文件")
+        return
+    print(f"共 {len(entries)} 个无法解码的文件（记录于 {quarantine.path}）:")
+    for path, entry in entries:
+        print(f"{entry['time']} {entry['error']} {entry['size']} 字节 - {path}")
+
 if __name__ == "__main__":
-    if len(sys.argv) > 1:
-        directory = sys.argv[1]
+    # 打包后的可执行文件中，解码进程需要由此进入
+    multiprocessing.freeze_support()
+    args = sys.argv[1:]
+    # --quarantine-report: 列出无法解码而被跳过的文件
+    if '--quarantine-report' in args:
+        print_quarantine_report()
+        sys.exit(0)
+    # --rotate: 同时匹配旋转/翻转后的图片
+    # --partial: 查找包含剪贴板图片（裁剪/局部截图）的原图
+    # --archives: 同时搜索 zip/tar 压缩包内的图片
+    # --color: 排序时考虑颜色差异
+    # --frames: 匹配动图中的任一帧
+    rotation_invariant = '--rotate' in args
+    partial_match = '--partial' in args
+    include_archives = '--archives' in args
+    color_weight = 0.3 if '--color' in args else 0.0
+    match_frames = '--frames' in args
+    # --io-workers=N / --cpu-workers=N / --read-ahead=N: 调节读取线程数、解码线程数和预读队列长度
+    # （机械硬盘适合较少的读取线程，SSD/网络盘可以加大）
+    pipeline_options = {'io_workers': 2, 'cpu_workers': 4, 'read_ahead': 32}
+    for arg in args:
+        name, _, value = arg.partition('=')
+        option = name[2:].replace('-', '_')
+        if arg.startswith('--') and option in pipeline_options:
+            try:
+                pipeline_options[option] = max(1, int(value))
+            except ValueError:
+                print(f"无效的参数值: {arg}")
+                sys.exit(1)
+    args = [a for a in args if not a.startswith('--')]
+    if args:
+        directory = args[0]
     else:
         directory = "."  # 默认为当前目录
     
     print("正在搜索相似图片...")
-    find_similar_images(directory) 
\ No newline at end of file
+    find_similar_images(directory, rotation_invariant=rotation_invariant,
+                        partial_match=partial_match, include_archives=include_archives,
+                        color_weight=color_weight, match_frames=match_frames,
+                        **pipeline_options) 
\ No newline at end of file
@@ -1,22 +1,41 @@
+import time
+_MODULE_START = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, filedialog, scrolledtext
+from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageGrab, ImageTk
-import imagehash
 from pathlib import Path
 import sys
-import shutil
 import os
-from datetime import datetime
 import threading
-import io
-from image_finder import get_image_hash, get_clipboard_image_hash, copy_similar_images
+import multiprocessing
+import bisect
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
-from functools import partial
-import asyncio
-import aiofiles
 from io import BytesIO
 import queue
-import win32clipboard
+
+_IMPORT_DONE = time.perf_counter()
+
+# 启动时不应加载的重量级依赖，首次搜索或后台预热时才导入
+HEAVY_MODULES = ('image_finder', 'imagehash', 'numpy', 'scipy', 'pywt',
+                 'asyncio', 'aiofiles', 'win32clipboard')
+
+# 结果网格中每个单元格的固定尺寸，用于根据滚动位置计算可见行
+RESULT_COLUMNS = 3
+CELL_WIDTH = 160
+CELL_HEIGHT = 185
+CELL_PAD = 5
+# 可见区域上下额外保留缩略图的行数
+VISIBLE_MARGIN_ROWS = 2
+
+# 预览缓存按像素字节数（宽 x 高 x 4）限制总大小
+PREVIEW_CACHE_BYTES = 64 * 1024 * 1024
+
+def _finder():
+    """按需加载 image_finder（会连带导入 imagehash/numpy/scipy/pywt）"""
+    import image_finder
+    return image_finder
 
 class ScrollableFrame(ttk.Frame):
     def __init__(self, container, *args, **kwargs):
@@ -31,11 +50,120 @@ class ScrollableFrame(ttk.Frame):
         )
 
         canvas.create_window((0, 0), window=self.scrollable_frame, anchor="nw")
-        canvas.configure(yscrollcommand=scrollbar.set)
+        
+        # 滚动或尺寸变化时通知 on_scroll，用于只加载可见区域的内容
+        self.canvas = canvas
+        self.on_scroll = None
+        def on_yscroll(first, last):
+            scrollbar.set(first, last)
+            if self.on_scroll:
+                self.on_scroll()
+        canvas.configure(yscrollcommand=on_yscroll)
 
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
 
+class PreviewCache:
+    """按近似像素字节数限制大小的 LRU 缓存，用于保存缩略图 PhotoImage"""
+    def __init__(self, max_bytes=PREVIEW_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._items = OrderedDict()  # key -> (photo, 字节数)
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """命中时返回缓存的图片并标记为最近使用，未命中返回 None"""
+        item = self._items.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, photo):
+        """加入缓存，超出字节预算时淘汰最久未使用的图片"""
+        size = photo.width() * photo.height() * 4
+        if key in self._items:
+            self.current_bytes -= self._items.pop(key)[1]
+        self._items[key] = (photo, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes and len(self._items) > 1:
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.current_bytes -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self._items.clear()
+        self.current_bytes = 0
+
+    def stats_text(self):
+        """用于状态栏显示的统计信息"""
+        return (f"预览缓存 {len(self._items)} 张/{self.current_bytes / 1024 / 1024:.1f}MB，"
+                f"命中 {self.hits}，未命中 {self.misses}，淘汰 {self.evictions}")
+
+class QueryResultCache:
+    """搜索结果的 LRU 缓存
+    
+    键由查询图片哈希、搜索目录和搜索选项组成，每条结果同时记录图库版本戳，
+    版本变化（文件增删改）时该条结果自动失效。
+    """
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # key -> (图库版本, 结果)
+
+    def get(self, key, version):
+        item = self._items.get(key)
+        if item is None or item[0] != version:
+            if item is not None:
+                # 图库已变化，丢弃过期结果
+                del self._items[key]
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._items.move_to_end(key)
+        return item[1]
+
+    def put(self, key, version, result):
+        self._items[key] = (version, result)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_entries:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+class SimilarityResultSet:
+    """按相似度降序保存的搜索结果，阈值筛选使用二分查找
+    
+    exact 中的路径（与查询文件字节完全相同）固定排在最前，且不受阈值限制。
+    """
+    def __init__(self, results=(), exact=()):
+        exact = set(exact)
+        results = sorted(results, key=lambda x: (x[0] in exact, x[1]), reverse=True)
+        self.exact_count = sum(1 for path, _ in results if path in exact)
+        self.paths = [path for path, _ in results]
+        self.similarities = [sim for _, sim in results]
+        # 其余结果的相似度取负后为升序，便于 bisect 查找
+        self._neg_similarities = [-sim for sim in self.similarities[self.exact_count:]]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        return self.paths[index], self.similarities[index]
+
+    def count_above(self, threshold):
+        """完全相同的结果加上相似度大于 threshold 的结果个数，即需要显示的前缀长度"""
+        return self.exact_count + bisect.bisect_left(self._neg_similarities, -threshold)
+
 class ImageFinderGUI:
     def __init__(self, root):
         self.root = root
@@ -52,21 +180,40 @@ class ImageFinderGUI:
         self.menubar = tk.Menu(root)
         root.config(menu=self.menubar)
         
+        # 创建设置菜单
+        self.settings_menu = tk.Menu(self.menubar, tearoff=0)
+        self.menubar.add_cascade(label="设置", menu=self.settings_menu)
+        self.settings_menu.add_command(label="搜索性能...", command=self.show_pipeline_settings)
+        
         # 创建帮助菜单
         self.help_menu = tk.Menu(self.menubar, tearoff=0)
         self.menubar.add_cascade(label="帮助", menu=self.help_menu)
+        self.help_menu.add_command(label="损坏文件列表", command=self.show_quarantine_report)
         self.help_menu.add_command(label="关于", command=self.show_about)
         
         # 初始化控制变量
         self.preview_enabled = True
         self.threshold_timer = None
-        self.photo_cache = {}
-        self.all_similar_images = []
+        self.photo_cache = PreviewCache()
+        self.result_cache = QueryResultCache()
+        self.all_similar_images = SimilarityResultSet()
         self.current_search_image = None
-        self.image_labels = []
+        self.current_search_path = None  # 从文件搜索时的文件路径，用于查找完全相同的副本
+        self.exact_paths = set()
+        self.image_labels = []  # 每个结果一个 frame，顺序与 all_similar_images 一致
+        self.display_count = 0
+        self.render_job = None
         self.load_queue = queue.Queue()
         self.is_loading = False
+        self.pending_thumbnails = 0
+        self.bound_thumbnails = set()  # 当前显示着缩略图的结果下标
+        self.visible_range = (0, 0)
+        self.refresh_job = None
         self.executor = ThreadPoolExecutor(max_workers=4)
+        # 搜索流水线的读取线程数、解码线程数和预读队列长度，可按磁盘类型分别调节
+        self.io_workers = 2
+        self.cpu_workers = 4
+        self.read_ahead = 32
         
         # 创建主框架
         self.main_frame = ttk.Frame(root, padding="10")
@@ -109,6 +256,36 @@ class ImageFinderGUI:
         self.file_btn = ttk.Button(self.search_frame, text="从文件搜索", command=self.start_file_search)
         self.file_btn.pack(side=tk.LEFT, padx=5)
         
+        # 旋转/翻转不变匹配
+        self.rotation_var = tk.BooleanVar(value=False)
+        self.rotation_check = ttk.Checkbutton(self.search_frame, text="匹配旋转/翻转",
+                                              variable=self.rotation_var)
+        self.rotation_check.pack(side=tk.LEFT, padx=5)
+        
+        # 局部/裁剪搜索
+        self.partial_var = tk.BooleanVar(value=False)
+        self.partial_check = ttk.Checkbutton(self.search_frame, text="局部/裁剪搜索",
+                                             variable=self.partial_var)
+        self.partial_check.pack(side=tk.LEFT, padx=5)
+        
+        # 匹配动图 GIF/WebP 中的任一帧
+        self.frames_var = tk.BooleanVar(value=False)
+        self.frames_check = ttk.Checkbutton(self.search_frame, text="匹配动图帧",
+                                            variable=self.frames_var)
+        self.frames_check.pack(side=tk.LEFT, padx=5)
+        
+        # 搜索压缩包内的图片
+        self.archive_var = tk.BooleanVar(value=False)
+        self.archive_check = ttk.Checkbutton(self.search_frame, text="搜索压缩包",
+                                             variable=self.archive_var)
+        self.archive_check.pack(side=tk.LEFT, padx=5)
+        
+        # 排序时考虑颜色差异
+        self.color_var = tk.BooleanVar(value=False)
+        self.color_check = ttk.Checkbutton(self.search_frame, text="颜色感知",
+                                           variable=self.color_var)
+        self.color_check.pack(side=tk.LEFT, padx=5)
+        
         # 创建预览区域
         self.preview_frame = ttk.LabelFrame(self.main_frame, text="剪贴板图片预览", padding="5")
         self.preview_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=5)
@@ -122,6 +299,7 @@ class ImageFinderGUI:
         
         self.scrollable_result = ScrollableFrame(self.result_frame)
         self.scrollable_result.pack(expand=True, fill="both")
+        self.scrollable_result.on_scroll = self.schedule_visible_refresh
         
         # 状态栏
         self.status_var = tk.StringVar(value="就绪")
@@ -137,8 +315,22 @@ class ImageFinderGUI:
         # 修改相似度变化事件绑定
         self.threshold_var.trace_add("write", self.on_threshold_change_debounced)
         
-        # 定时更新预览
+        # 窗口绘制完成后再开始轮询剪贴板和预热依赖，保证窗口立即可交互
+        self.root.after_idle(self.start_background_tasks)
+    
+    def start_background_tasks(self):
+        """启动剪贴板预览轮询，并在后台线程中预热重量级依赖"""
         self.update_preview()
+        thread = threading.Thread(target=self.warm_up)
+        thread.daemon = True
+        thread.start()
+    
+    def warm_up(self):
+        """后台导入哈希相关依赖，缩短首次搜索的等待"""
+        try:
+            _finder()
+        except Exception as e:
+            print(f"预热依赖失败: {e}")
     
     def browse_directory(self):
         directory = filedialog.askdirectory(initialdir=self.dir_var.get())
@@ -169,11 +361,8 @@ class ImageFinderGUI:
     def start_search(self):
         """开始搜索"""
         # 清除旧的显示结果
-        for label in self.image_labels:
-            label.destroy()
-        self.image_labels.clear()
-        self.photo_cache.clear()
-        self.all_similar_images = []
+        self.clear_image_results()
+        self.all_similar_images = SimilarityResultSet()
         
         # 清除预览
         self.preview_label.configure(image='', text="等待图片...")
@@ -189,20 +378,17 @@ class ImageFinderGUI:
         thread.start()
     
     def on_threshold_change_debounced(self, *args):
-        """使用防抖动机制处理相似度变化，延迟1秒"""
+        """使用防抖动机制处理相似度变化，增量更新很快，只需合并连续的滑动事件"""
         if self.threshold_timer:
             self.root.after_cancel(self.threshold_timer)
-        self.threshold_timer = self.root.after(1000, self.on_threshold_change)  # 改为1000毫秒（1秒）
+        self.threshold_timer = self.root.after(100, self.on_threshold_change)
     
     def on_threshold_change(self):
-        """当相似度阈值改变时只从现有结果中筛选"""
+        """当相似度阈值改变时只从现有结果中筛选，并只增删跨过阈值的结果"""
+        self.threshold_timer = None
         if self.all_similar_images:
             threshold = self.threshold_var.get()
-            filtered_images = [(path, sim) for path, sim in self.all_similar_images 
-                             if sim > threshold]
-            self.show_image_results(filtered_images)
-            # 更新状态栏显示筛选后的数量
-            self.update_status(f"找到 {len(filtered_images)} 个相似图片")
+            self.show_image_results(self.all_similar_images.count_above(threshold))
     
     def start_clipboard_search(self):
         """从剪贴板开始搜索"""
@@ -210,6 +396,7 @@ class ImageFinderGUI:
         clipboard_image = ImageGrab.grabclipboard()
         if clipboard_image:
             self.current_search_image = clipboard_image
+            self.current_search_path = None
             self.start_search()
         else:
             self.update_status("剪贴板中没有图片")
@@ -227,6 +414,7 @@ class ImageFinderGUI:
             try:
                 img = Image.open(file_path)
                 self.current_search_image = img
+                self.current_search_path = file_path
                 
                 # 更新预览
                 preview_size = (200, 200)
@@ -242,23 +430,33 @@ class ImageFinderGUI:
                 self.preview_enabled = True  # 恢复剪贴板预览
 
     def get_search_image_hash(self):
-        """获取搜索图片的哈希值"""
+        """获取搜索图片的哈希值，与图库图片使用相同的缩放和哈希算法"""
         try:
             if self.current_search_image is None:
                 return None
             
-            if self.current_search_image.mode != 'RGB':
-                img = self.current_search_image.convert('RGB')
-            else:
-                img = self.current_search_image
-            
-            img = img.resize((64, 64), Image.Resampling.LANCZOS)
-            
-            avg_hash = imagehash.average_hash(img)
-            dhash = imagehash.dhash(img)
-            phash = imagehash.phash(img)
+            return _finder().get_pil_image_hash(self.current_search_image)
+        except Exception as e:
+            print(f"计算图片哈希值失败: {e}")
+            return None
+
+    def get_search_variant_bits(self, rotation_invariant=True):
+        """获取搜索图片的打包哈希，shape (V, 3, B)
+        
+        rotation_invariant 为 True 时包含8种旋转/翻转变体，否则只有原始方向。
+        """
+        try:
+            if self.current_search_image is None:
+                return None
             
-            return (avg_hash, dhash, phash)
+            import numpy as np
+            finder = _finder()
+            if rotation_invariant:
+                variant_hashes, _, _ = finder.get_variant_hashes(self.current_search_image)
+            else:
+                # 只有原始方向，与不开启旋转匹配时的哈希完全相同
+                variant_hashes = [finder.get_pil_image_hash(self.current_search_image)]
+            return np.stack([finder.hashes_to_bits(h) for h in variant_hashes])
         except Exception as e:
             print(f"计算图片哈希值失败: {e}")
             return None
@@ -266,14 +464,25 @@ class ImageFinderGUI:
     def search_similar_images(self):
         """搜索相似图片的实现"""
         try:
-            # 清除旧的搜索结果和缓存
-            self.all_similar_images = []
-            self.photo_cache.clear()
+            # 清除旧的搜索结果（预览缓存有大小上限，保留以便重复搜索时复用）
+            self.all_similar_images = SimilarityResultSet()
             
             directory = self.dir_var.get()
-            display_threshold = self.threshold_var.get()
             
-            search_hashes = self.get_search_image_hash()
+            # 首次搜索时加载哈希依赖（若后台预热已完成则不再耗时）
+            self.update_status("正在加载依赖...")
+            finder = _finder()
+            
+            rotation_invariant = self.rotation_var.get()
+            partial_match = self.partial_var.get()
+            match_frames = self.frames_var.get()
+            # 子区域和动图帧的哈希都存放在子哈希数组中，按所属图片汇总匹配结果
+            has_sub_hashes = partial_match or match_frames
+            vectorized = rotation_invariant or has_sub_hashes
+            if vectorized:
+                search_hashes = self.get_search_variant_bits(rotation_invariant)
+            else:
+                search_hashes = self.get_search_image_hash()
             if search_hashes is None:
                 self.update_status("获取搜索图片失败")
                 return
@@ -281,50 +490,106 @@ class ImageFinderGUI:
             similar_images = []
             image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
             processed_count = 0
-            total_files = sum(1 for p in Path(directory).rglob('*') 
-                             if p.suffix.lower() in image_extensions)
+            include_archives = self.archive_var.get()
+            image_paths = []
+            archives = []
+            for p in Path(directory).rglob('*'):
+                if p.suffix.lower() in image_extensions:
+                    image_paths.append(p)
+                elif include_archives and finder.is_archive(p) and p.is_file():
+                    archives.append(p)
+            
+            # 相同查询图片、目录和选项且图库未变化时，直接复用上次的结果
+            if hasattr(search_hashes, 'tobytes'):
+                query_key = search_hashes.tobytes()
+            else:
+                query_key = tuple(str(h) for h in search_hashes[:3])
+            # 哈希相同但颜色不同的查询图片排序不同，开启颜色比较时颜色签名也是键的一部分
+            color_key = None
+            if self.color_var.get():
+                color_key = finder.get_color_signature(self.current_search_image).tobytes()
+            cache_key = (query_key, str(Path(directory).resolve()), rotation_invariant,
+                         partial_match, match_frames, include_archives, color_key,
+                         self.current_search_path)
+            version = finder.library_version(image_paths + archives)
+            cached = self.result_cache.get(cache_key, version)
+            if cached is not None:
+                self.root.after(0, lambda: self.show_search_results(*cached))
+                return
             
             self.update_status("正在搜索...")
             
-            def process_image(image_path, search_hashes):
+            def score_hashes(image_path, img_hashes):
+                if vectorized:
+                    # 先收集图库哈希（或子区域哈希），之后一次性与所有变体比较
+                    if has_sub_hashes:
+                        return (image_path, img_hashes[5], img_hashes[4])
+                    return (image_path, finder.hashes_to_bits(img_hashes)[None], img_hashes[4])
+                # 计算三种哈希的平均差异
+                diffs = [h1 - h2 for h1, h2 in zip(search_hashes[:3], img_hashes[:3])]
+                avg_diff = sum(diffs) / len(diffs)
+                similarity = 100 - (avg_diff/64*100)
+                return (image_path, similarity, img_hashes[4])
+            
+            # 从文件搜索时，与查询文件字节一致的图片作为"完全相同"单独标出
+            exact_query = None
+            if self.current_search_path:
                 try:
-                    if image_path.suffix.lower() in image_extensions:
-                        img_hashes = get_image_hash(image_path)
-                        if img_hashes is not None:
-                            # 计算三种哈希的平均差异
-                            diffs = [h1 - h2 for h1, h2 in zip(search_hashes, img_hashes)]
-                            avg_diff = sum(diffs) / len(diffs)
-                            similarity = 100 - (avg_diff/64*100)
-                            return (image_path, similarity)
-                except Exception:
+                    exact_query = Path(self.current_search_path).read_bytes()
+                except OSError:
                     pass
-                return None
             
-            # 使用线程池进行并行处理
-            with ThreadPoolExecutor(max_workers=4) as executor:
-                process_func = partial(process_image, search_hashes=search_hashes)
-                for result in executor.map(process_func, Path(directory).rglob('*')):
-                    processed_count += 1
-                    if result:
-                        similar_images.append(result)
-                    if processed_count % 10 == 0:
-                        self.update_status(f"正在搜索... {processed_count}/{total_files}")
+            # 读取与解码分离：I/O 线程按目录顺序预读文件，解码线程池并行计算哈希；
+            # 字节完全相同的文件只解码一次，共用哈希
+            pipeline = finder.ReadAheadPipeline(io_workers=self.io_workers,
+                                                cpu_workers=self.cpu_workers,
+                                                read_ahead=self.read_ahead,
+                                                tiles=partial_match,
+                                                frames=match_frames,
+                                                exact_query=exact_query,
+                                                quarantine=finder.Quarantine(),
+                                                image_extensions=image_extensions)
+            # 压缩包内的图片不解压，由读取线程直接取出成员内容，与普通文件一同解码
+            total_files = len(image_paths)
+            for image_path, img_hashes in pipeline.run(image_paths + archives):
+                try:
+                    similar_images.append(score_hashes(image_path, img_hashes))
+                except Exception:
+                    pass
+                processed_count += 1
+                if processed_count % 10 == 0:
+                    depths = pipeline.queue_depths()
+                    done_count = pipeline.files_hashed + pipeline.duplicates_skipped
+                    self.update_status(f"正在搜索... {done_count}/{total_files} "
+                                       f"(预读队列 {depths['read']}，解码中 {depths['decode']})")
             
-            # 按相似度降序排序
-            similar_images.sort(key=lambda x: x[1], reverse=True)
+            if vectorized and similar_images:
+                tile_bits, owners = finder.stack_tile_index([bits for _, bits, _ in similar_images])
+                tile_diffs, _ = finder.match_hash_variants(search_hashes, tile_bits)
+                best_diffs, _ = finder.aggregate_tile_matches(tile_diffs, owners, len(similar_images))
+                similar_images = [(path, 100 - (diff/64*100), color)
+                                  for (path, _, color), diff in zip(similar_images, best_diffs.tolist())]
             
-            # 存储所有结果
-            self.all_similar_images = similar_images
+            if self.color_var.get() and similar_images:
+                # 颜色签名在计算哈希时已得到，一次向量化比较后混入相似度
+                import numpy as np
+                query_color = finder.get_color_signature(self.current_search_image)
+                color_dists = finder.color_distances(
+                    query_color, np.stack([color for _, _, color in similar_images]))
+                hash_dists = np.array([1 - sim / 100 for _, sim, _ in similar_images])
+                blended = finder.blend_color_distance(hash_dists, color_dists)
+                similar_images = [(path, 100 * (1 - dist), color)
+                                  for (path, _, color), dist in zip(similar_images, blended.tolist())]
             
-            # 显示超过阈值的结果
-            filtered_images = [(path, sim) for path, sim in similar_images 
-                             if sim > display_threshold]
+            # 按相似度降序存储所有结果，与查询文件完全相同的文件排在最前且不受阈值限制
+            exact_paths = set(pipeline.exact_matches)
+            result_set = SimilarityResultSet([(path, sim) for path, sim, _ in similar_images],
+                                             exact=exact_paths)
+            # 有文件读取失败（可能是暂时性的）或新记录了损坏文件时不缓存，下次搜索重新扫描
+            if not pipeline.read_errors and not pipeline.decode_failures:
+                self.result_cache.put(cache_key, version, (result_set, exact_paths))
             
-            if filtered_images:
-                self.show_image_results(filtered_images)
-                self.update_status(f"找到 {len(filtered_images)} 个相似图片")
-            else:
-                self.update_status("未找到相似图片")
+            self.root.after(0, lambda: self.show_search_results(result_set, exact_paths))
         
         except Exception as e:
             self.update_status(f"搜索出错: {str(e)}")
@@ -334,77 +599,122 @@ class ImageFinderGUI:
             self.root.after(0, lambda: self.clipboard_btn.configure(state='normal'))
             self.root.after(0, lambda: self.file_btn.configure(state='normal'))
     
+    def show_search_results(self, result_set, exact_paths):
+        """显示一次搜索的结果，只显示超过当前阈值的部分"""
+        self.all_similar_images = result_set
+        self.exact_paths = exact_paths
+        self.show_image_results(result_set.count_above(self.threshold_var.get()))
+
     def update_status(self, message):
         """更新状态栏"""
         self.root.after(0, lambda: self.status_var.set(message))
     
-    async def load_image_async(self, path):
-        """异步加载图片"""
-        try:
-            async with aiofiles.open(path, 'rb') as f:
-                data = await f.read()
-            img = Image.open(BytesIO(data))
-            img.thumbnail((150, 150), Image.Resampling.LANCZOS)
-            return img
-        except Exception as e:
-            print(f"加载图片失败 {path}: {e}")
-            return None
+    def request_thumbnail(self, idx, img_label, path):
+        """在线程池中解码缩略图，完成后由主线程的 process_load_queue 显示"""
+        img_label.loading = True
+        future = self.executor.submit(self.load_image_sync, path)
+        future.add_done_callback(lambda f: self.load_queue.put((idx, img_label, path, f)))
+        self.pending_thumbnails += 1
+        if not self.is_loading:
+            self.is_loading = True
+            self.root.after(50, self.process_load_queue)
 
     def process_load_queue(self):
-        """处理加载队列"""
-        if self.load_queue.empty() or not self.is_loading:
+        """在主线程中把已解码的缩略图转换为 PhotoImage 并显示"""
+        while True:
+            try:
+                idx, img_label, path, future = self.load_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.pending_thumbnails -= 1
+            try:
+                # 控件可能已因阈值变化或新的搜索被删除
+                alive = img_label.winfo_exists()
+                if alive:
+                    img_label.loading = False
+                img = future.result()
+                if img is None:
+                    if alive:
+                        img_label.configure(text="加载失败")
+                    continue
+                photo = ImageTk.PhotoImage(img)
+                self.photo_cache.put(path, photo)
+                # 只有仍在可见区域内的结果才持有缩略图
+                first, last = self.visible_range
+                if alive and first <= idx < last:
+                    self.show_thumbnail(idx, img_label, photo)
+            except Exception as e:
+                print(f"处理图片失败 {path}: {e}")
+        
+        # 还有未完成的缩略图时继续处理队列
+        if self.pending_thumbnails:
+            self.root.after(50, self.process_load_queue)
+        else:
             self.is_loading = False
-            return
-
-        try:
-            frame, path, similarity = self.load_queue.get_nowait()
-            
-            if path in self.photo_cache:
-                self.show_single_result(frame, path, similarity, self.photo_cache[path])
-            else:
-                # 在线程池中加载图片
-                future = self.executor.submit(self.load_image_sync, path)
-                self.root.after(100, lambda: self.handle_loaded_image(future, frame, path, similarity))
-        except queue.Empty:
-            pass
-
-        # 继续处理队列
-        self.root.after(50, self.process_load_queue)
 
     def load_image_sync(self, path):
         """同步加载图片"""
         try:
-            img = Image.open(path)
+            img = _finder().open_image(path)
             img.thumbnail((150, 150), Image.Resampling.LANCZOS)
+            img.load()
             return img
         except Exception as e:
             print(f"加载图片失败 {path}: {e}")
             return None
 
-    def handle_loaded_image(self, future, frame, path, similarity):
-        """处理加载完成的图片"""
-        try:
-            img = future.result()
-            if img:
-                photo = ImageTk.PhotoImage(img)
-                self.photo_cache[path] = photo
-                self.show_single_result(frame, path, similarity, photo)
-        except Exception as e:
-            print(f"处理图片失败 {path}: {e}")
-        finally:
-            self.root.after(50, self.process_load_queue)
-
-    def show_single_result(self, frame, path, similarity, photo):
-        """显示单个图片结果"""
-        img_label = ttk.Label(frame, image=photo)
+    def show_thumbnail(self, idx, img_label, photo):
+        """在结果控件中显示缩略图"""
+        img_label.configure(image=photo, text='')
         img_label.image = photo
-        img_label.pack()
-        
-        text = f"相似度: {similarity:.2f}%"
-        text_label = ttk.Label(frame, text=text)
-        text_label.pack()
-        
-        self.image_labels.extend([frame, img_label, text_label])
+        self.bound_thumbnails.add(idx)
+
+    def release_thumbnail(self, idx):
+        """释放移出可见区域的缩略图，之后只由大小受限的预览缓存持有"""
+        self.bound_thumbnails.discard(idx)
+        if idx < len(self.image_labels) and hasattr(self.image_labels[idx], 'img_label'):
+            img_label = self.image_labels[idx].img_label
+            img_label.configure(image='', text="")
+            img_label.image = None
+
+    def schedule_visible_refresh(self):
+        """合并连续的滚动事件，稍后刷新可见区域的缩略图"""
+        if self.refresh_job is None:
+            self.refresh_job = self.root.after(30, self.refresh_visible_thumbnails)
+
+    def refresh_visible_thumbnails(self):
+        """只为可见行（及上下少量余量）加载缩略图，其余结果释放图片
+        
+        这样同时存活的 PhotoImage 只有可见区域内的和预览缓存中的，
+        滚动浏览大量结果时内存保持平稳。
+        """
+        self.refresh_job = None
+        canvas = self.scrollable_result.canvas
+        top = canvas.canvasy(0)
+        bottom = top + canvas.winfo_height()
+        row_height = CELL_HEIGHT + 2 * CELL_PAD
+        first = max(0, int(top // row_height) - VISIBLE_MARGIN_ROWS) * RESULT_COLUMNS
+        last = (int(bottom // row_height) + 1 + VISIBLE_MARGIN_ROWS) * RESULT_COLUMNS
+        last = min(last, len(self.image_labels))
+        self.visible_range = (first, last)
+        
+        for idx in list(self.bound_thumbnails):
+            if not first <= idx < last:
+                self.release_thumbnail(idx)
+        
+        for idx in range(first, last):
+            if idx in self.bound_thumbnails:
+                continue
+            frame = self.image_labels[idx]
+            if not hasattr(frame, 'img_label') or getattr(frame.img_label, 'loading', False):
+                continue
+            # 使用缓存，未命中时在线程池中解码
+            photo = self.photo_cache.get(frame.path)
+            if photo is None:
+                frame.img_label.configure(text="加载中...")
+                self.request_thumbnail(idx, frame.img_label, frame.path)
+            else:
+                self.show_thumbnail(idx, frame.img_label, photo)
 
     def create_context_menu(self):
         """创建右键菜单"""
@@ -413,70 +723,89 @@ class ImageFinderGUI:
         menu.add_command(label="保存原图", command=self.save_original_image)
         return menu
 
-    def show_image_results(self, similar_images):
-        """使用简单的分批加载方式显示图片结果"""
-        # 清除旧的图片显示
-        for label in self.image_labels:
-            label.destroy()
+    def clear_image_results(self):
+        """清除所有结果并停止正在进行的分批加载"""
+        if self.render_job is not None:
+            self.root.after_cancel(self.render_job)
+            self.render_job = None
+        for frame in self.image_labels:
+            frame.destroy()
         self.image_labels.clear()
+        self.bound_thumbnails.clear()
+        self.display_count = 0
+
+    def show_image_results(self, count):
+        """显示 all_similar_images 中相似度最高的 count 个结果
+        
+        结果按相似度降序排列在网格中，阈值变化只影响列表尾部，
+        因此只需删除或追加跨过阈值的那部分，其余控件保持不变。
+        """
+        self.display_count = count
+        
+        # 删除跨过阈值的结果
+        while len(self.image_labels) > count:
+            self.image_labels.pop().destroy()
+            self.bound_thumbnails.discard(len(self.image_labels))
+        
+        if len(self.image_labels) < count:
+            if self.render_job is None:
+                self.update_status(f"开始加载 {count - len(self.image_labels)} 个图片...")
+                self.load_result_batch()
+        elif count:
+            self.update_status(f"找到 {count} 个相似图片")
+        else:
+            self.update_status("未找到相似图片")
+
+    def load_result_batch(self):
+        """分批追加结果控件，直到显示数量达到 display_count"""
+        self.render_job = None
+        columns = RESULT_COLUMNS
+        batch_size = 60  # 缩略图按可见区域在线程池中解码，主线程只创建控件
+        
+        start_idx = len(self.image_labels)
+        end_idx = min(start_idx + batch_size, self.display_count)
+        
+        for idx in range(start_idx, end_idx):
+            path, similarity = self.all_similar_images[idx]
+            # 固定尺寸的单元格，缩略图未加载时布局也不变
+            frame = ttk.Frame(self.scrollable_result.scrollable_frame,
+                              width=CELL_WIDTH, height=CELL_HEIGHT)
+            frame.pack_propagate(False)
+            frame.grid(row=idx // columns, column=idx % columns, padx=CELL_PAD, pady=CELL_PAD)
+            frame.path = path
+            # 即使加载失败也保留 frame，保证控件位置与结果下标一致
+            self.image_labels.append(frame)
+            try:
+                img_label = ttk.Label(frame)
+                img_label.pack()
+                frame.img_label = img_label
+                
+                # 存储图片路径
+                img_label.path = path
+                
+                # 绑定点击事件
+                img_label.bind('<Button-1>', lambda e, p=path: self.copy_original_image(p))
+                img_label.bind('<Button-3>', self.show_context_menu)
+                
+                if path in self.exact_paths:
+                    text = "完全相同"
+                else:
+                    text = f"相似度: {similarity:.2f}%"
+                text_label = ttk.Label(frame, text=text)
+                text_label.pack()
+                
+            except Exception as e:
+                print(f"加载图片失败 {path}: {e}")
         
-        columns = 3
-        batch_size = 12  # 增加每批加载的数量
+        self.schedule_visible_refresh()
         
-        def load_batch(start_idx):
-            if start_idx >= len(similar_images):
-                # 所有图片加载完成后更新状态
-                self.update_status(f"找到 {len(self.image_labels) // 3} 个相似图片")
-                return
-            
-            end_idx = min(start_idx + batch_size, len(similar_images))
-            current_batch = similar_images[start_idx:end_idx]
-            
-            for idx, (path, similarity) in enumerate(current_batch, start_idx):
-                try:
-                    frame = ttk.Frame(self.scrollable_result.scrollable_frame)
-                    frame.grid(row=idx // columns, column=idx % columns, padx=5, pady=5)
-                    
-                    # 使用缓存
-                    if path in self.photo_cache:
-                        photo = self.photo_cache[path]
-                    else:
-                        img = Image.open(path)
-                        img.thumbnail((150, 150), Image.Resampling.LANCZOS)
-                        photo = ImageTk.PhotoImage(img)
-                        self.photo_cache[path] = photo
-                    
-                    img_label = ttk.Label(frame, image=photo)
-                    img_label.image = photo
-                    img_label.pack()
-                    
-                    # 存储图片路径
-                    img_label.path = path
-                    
-                    # 绑定点击事件
-                    img_label.bind('<Button-1>', lambda e, p=path: self.copy_original_image(p))
-                    img_label.bind('<Button-3>', self.show_context_menu)
-                    
-                    text = f"相似度: {similarity:.2f}%"
-                    text_label = ttk.Label(frame, text=text)
-                    text_label.pack()
-                    
-                    self.image_labels.extend([frame, img_label, text_label])
-                    
-                except Exception as e:
-                    print(f"加载图片失败 {path}: {e}")
-            
+        if len(self.image_labels) < self.display_count:
             # 更新加载进度
-            self.update_status(f"正在加载... {min(end_idx, len(similar_images))}/{len(similar_images)}")
-            
-            if end_idx < len(similar_images):
-                self.root.after(50, lambda: load_batch(end_idx))
-        
-        if similar_images:
-            self.update_status(f"开始加载 {len(similar_images)} 个图片...")
-            load_batch(0)
+            self.update_status(f"正在加载... {len(self.image_labels)}/{self.display_count}")
+            self.render_job = self.root.after(10, self.load_result_batch)
         else:
-            self.update_status("未找到相似图片")
+            # 所有图片加载完成后更新状态
+            self.update_status(f"找到 {self.display_count} 个相似图片 | {self.photo_cache.stats_text()}")
 
     def show_context_menu(self, event):
         """显示右键菜单"""
@@ -494,7 +823,7 @@ class ImageFinderGUI:
                 path = self.selected_path
             
             if path:
-                img = Image.open(path)
+                img = _finder().open_image(path)
                 # 转换图片格式
                 if img.mode != 'RGB':
                     img = img.convert('RGB')
@@ -506,6 +835,7 @@ class ImageFinderGUI:
                 output.close()
                 
                 # 复制到剪贴板
+                import win32clipboard
                 win32clipboard.OpenClipboard()
                 win32clipboard.EmptyClipboard()
                 win32clipboard.SetClipboardData(win32clipboard.CF_DIB, data)
@@ -530,11 +860,85 @@ class ImageFinderGUI:
                     ]
                 )
                 if save_path:
-                    shutil.copy2(self.selected_path, save_path)
+                    _finder().copy_image_file(self.selected_path, save_path)
                     self.update_status(f"已保存图片到: {save_path}")
             except Exception as e:
                 self.update_status(f"保存图片失败: {str(e)}")
 
+    def show_quarantine_report(self):
+        """显示被记录为无法解码、扫描时跳过的文件"""
+        quarantine = _finder().Quarantine()
+        
+        report_window = tk.Toplevel(self.root)
+        report_window.title("损坏文件列表")
+        report_window.geometry("600x400")
+        report_window.transient(self.root)
+        
+        text = tk.Text(report_window, wrap=tk.NONE, padx=10, pady=10)
+        text.pack(expand=True, fill=tk.BOTH)
+        
+        def refresh():
+            text.config(state=tk.NORMAL)
+            text.delete("1.0", tk.END)
+            entries = quarantine.report()
+            if not entries:
+                text.insert("1.0", "没有记录的损坏文件")
+            for path, entry in entries:
+                text.insert(tk.END, f"{entry['time']}  {entry['error']}  {entry['size']} 字节  {path}\n")
+            text.config(state=tk.DISABLED)  # 使文本只读
+        
+        def clear():
+            # 清空记录后，下次扫描会重新尝试解码这些文件，缓存的结果中不包含它们
+            quarantine.clear()
+            quarantine.save()
+            self.result_cache.clear()
+            refresh()
+        
+        button_frame = ttk.Frame(report_window)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="清空记录", command=clear).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="关闭", command=report_window.destroy).pack(side=tk.LEFT, padx=5)
+        
+        refresh()
+
+    def show_pipeline_settings(self):
+        """调节搜索流水线的读取线程数、解码线程数和预读队列长度"""
+        settings_window = tk.Toplevel(self.root)
+        settings_window.title("搜索性能")
+        settings_window.resizable(False, False)
+        settings_window.transient(self.root)
+        
+        form = ttk.Frame(settings_window, padding="10")
+        form.pack()
+        
+        # 机械硬盘适合较少的读取线程，SSD/网络盘可以加大读取线程数和预读长度
+        fields = [
+            ("读取线程数", 'io_workers', 1, 16),
+            ("解码线程数", 'cpu_workers', 1, 32),
+            ("预读队列长度", 'read_ahead', 1, 256),
+        ]
+        variables = {}
+        for row, (label, attr, low, high) in enumerate(fields):
+            ttk.Label(form, text=label).grid(row=row, column=0, sticky=tk.W, padx=5, pady=5)
+            variables[attr] = tk.IntVar(value=getattr(self, attr))
+            ttk.Spinbox(form, from_=low, to=high, width=8,
+                        textvariable=variables[attr]).grid(row=row, column=1, padx=5, pady=5)
+        
+        def apply():
+            try:
+                values = {attr: max(1, variables[attr].get()) for attr in variables}
+            except tk.TclError:
+                messagebox.showerror("错误", "请输入整数", parent=settings_window)
+                return
+            for attr, value in values.items():
+                setattr(self, attr, value)
+            settings_window.destroy()
+        
+        button_frame = ttk.Frame(settings_window)
+        button_frame.pack(pady=10)
+        ttk.Button(button_frame, text="确定", command=apply).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="取消", command=settings_window.destroy).pack(side=tk.LEFT, padx=5)
+
     def show_about(self):
         """显示关于对话框"""
         about_window = tk.Toplevel(self.root)
@@ -587,10 +991,28 @@ class ImageFinderGUI:
         y = (about_window.winfo_screenheight() // 2) - (height // 2)
         about_window.geometry(f"{width}x{height}+{x}+{y}")
 
+def report_startup(root, eager_modules):
+    """输出导入耗时与首次绘制耗时，用于发现启动性能回退"""
+    root.update()
+    first_paint = time.perf_counter()
+    print(f"模块导入耗时: {(_IMPORT_DONE - _MODULE_START) * 1000:.1f} ms")
+    print(f"首次绘制耗时: {(first_paint - _MODULE_START) * 1000:.1f} ms")
+    if eager_modules:
+        print(f"启动时已加载重量级依赖: {', '.join(eager_modules)}")
+    root.destroy()
+    sys.exit(1 if eager_modules else 0)
+
 def main():
+    # --startup-time: 测量启动耗时后退出，若启动阶段加载了重量级依赖则返回非零
+    measure_startup = '--startup-time' in sys.argv
     root = tk.Tk()
     app = ImageFinderGUI(root)
+    if measure_startup:
+        eager_modules = [m for m in HEAVY_MODULES if m in sys.modules]
+        root.after_idle(lambda: report_startup(root, eager_modules))
     root.mainloop()
 
 if __name__ == "__main__":
+    # 打包后的可执行文件中，搜索使用的解码进程需要由此进入
+    multiprocessing.freeze_support()
     main() 
\ No newline at end of file
@@ -0,0 +1,126 @@
+import os
+import time
+import zipfile
+from io import BytesIO
+
+from PIL import Image
+
+import image_finder
+
+
+def slow_hash_image(image_path, tiles=False, frames=False):
+    # 模拟在解码器中卡住的文件
+    if image_path.name.endswith('stuck.png'):
+        time.sleep(60)
+    return image_finder._hash_image(image_path, tiles, frames)
+
+
+def crashing_hash_image(image_path, tiles=False, frames=False):
+    # 模拟让解码进程直接退出的文件
+    if image_path.name.endswith('crash.png'):
+        time.sleep(0.5)  # 保证其他文件同时在解码
+        os._exit(1)
+    time.sleep(0.5)
+    return image_finder._hash_image(image_path, tiles, frames)
+
+
+class StuckDecodePipeline(image_finder.ReadAheadPipeline):
+    hash_function = staticmethod(slow_hash_image)
+
+
+class CrashingDecodePipeline(image_finder.ReadAheadPipeline):
+    hash_function = staticmethod(crashing_hash_image)
+
+
+def make_images(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f'{i}.png'
+        Image.new('RGB', (64, 64), (i * 40, 255 - i * 40, 128)).save(path)
+        paths.append(path)
+    return paths
+
+
+def test_decode_timeout_only_quarantines_stuck_file(tmp_path):
+    paths = make_images(tmp_path, 6)
+    stuck = tmp_path / 'stuck.png'
+    Image.new('RGB', (64, 64), (0, 0, 0)).save(stuck)
+    quarantine = image_finder.Quarantine(tmp_path / 'quarantine.json')
+
+    # 只有一个解码进程：卡住的文件不能让排在后面的文件一起超时
+    pipeline = StuckDecodePipeline(cpu_workers=1, decode_timeout=1, quarantine=quarantine)
+    start = time.monotonic()
+    results = dict(pipeline.run([stuck] + paths))
+
+    assert set(results) == set(paths)
+    assert [path for path, _ in quarantine.report()] == [str(stuck)]
+    assert quarantine.report()[0][1]['error'] == 'TimeoutError'
+    assert pipeline.decode_failures == 1
+    # 卡住的解码进程被结束，而不是等到它自己返回
+    assert time.monotonic() - start < 30
+
+
+def test_decoder_crash_only_quarantines_crashing_file(tmp_path):
+    paths = make_images(tmp_path, 3)
+    crash = tmp_path / 'crash.png'
+    Image.new('RGB', (64, 64), (0, 0, 0)).save(crash)
+    quarantine = image_finder.Quarantine(tmp_path / 'quarantine.json')
+
+    # 与崩溃文件同时在解码的文件会重试，而不是一起被记录
+    pipeline = CrashingDecodePipeline(cpu_workers=4, quarantine=quarantine)
+    results = dict(pipeline.run([crash] + paths))
+
+    assert set(results) == set(paths)
+    assert [path for path, _ in quarantine.report()] == [str(crash)]
+    assert quarantine.report()[0][1]['error'] == 'BrokenProcessPool'
+    assert pipeline.decode_failures == 1
+
+
+def test_duplicates_and_exact_matches_share_one_decode(tmp_path):
+    paths = make_images(tmp_path, 3)
+    copy = tmp_path / 'copy.png'
+    copy.write_bytes(paths[1].read_bytes())
+
+    pipeline = image_finder.ReadAheadPipeline(cpu_workers=2,
+                                              exact_query=paths[1].read_bytes())
+    results = dict(pipeline.run(paths + [copy]))
+
+    assert set(results) == set(paths) | {copy}
+    assert pipeline.files_hashed == 3
+    assert set(pipeline.duplicate_of.items()) <= {(copy, paths[1]), (paths[1], copy)}
+    assert pipeline.exact_matches == {paths[1], copy}
+
+
+def test_archive_members_are_decoded_and_quarantined_individually(tmp_path):
+    images = {}
+    for name, color in [('a.png', (255, 0, 0)), ('b.png', (0, 255, 0)), ('bad-crc.png', (0, 0, 255))]:
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), color).save(buffer, format='PNG')
+        images[name] = buffer.getvalue()
+    archive = tmp_path / 'images.zip'
+    with zipfile.ZipFile(archive, 'w', compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr('a.png', images['a.png'])
+        zf.writestr('broken.png', b'not an image')
+        zf.writestr('bad-crc.png', images['bad-crc.png'])
+        zf.writestr('b.png', images['b.png'])
+    # 破坏一个成员的数据，使其 CRC 校验失败
+    content = bytearray(archive.read_bytes())
+    offset = content.index(images['bad-crc.png']) + len(images['bad-crc.png']) // 2
+    content[offset] ^= 0xFF
+    archive.write_bytes(bytes(content))
+    quarantine = image_finder.Quarantine(tmp_path / 'quarantine.json')
+
+    pipeline = image_finder.ReadAheadPipeline(quarantine=quarantine)
+    results = dict(pipeline.run([archive]))
+
+    member = f'{archive}{image_finder.ARCHIVE_SEPARATOR}'
+    # 损坏的成员不影响排在其后的成员
+    assert {str(path) for path in results} == {member + 'a.png', member + 'b.png'}
+    assert [path for path, _ in quarantine.report()] == [member + 'bad-crc.png',
+                                                         member + 'broken.png']
+
+    # 压缩包未变化时，已记录的成员直接跳过
+    pipeline = image_finder.ReadAheadPipeline(quarantine=quarantine)
+    assert len(list(pipeline.run([archive]))) == 2
+    assert pipeline.quarantined_skipped == 2
+    assert pipeline.decode_failures == 0